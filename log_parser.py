@@ -2,25 +2,23 @@ import gzip
 from pathlib import Path
 import re
 from datetime import datetime, timezone
-import json
 
 from death_messages import is_death_message
-from tables import User, UserDeath, VillagerDeath, PlaySession, ChatMessage
+from tables import User, UserDeath, VillagerDeath, PlaySession, ChatMessage, UsernameHistory
 from villages import village_index
 
-from sqlalchemy import select
+from sqlalchemy import inspect, select, text
 from sqlalchemy.orm import Session as DBSession
 
 file_name_parser = re.compile(r"^(\d\d\d\d)-(\d\d)-(\d\d)-\d.log.gz")
 time_parser = re.compile(r"(\d\d):(\d\d):(\d\d)")
 line_parser = re.compile(r"^\[(\d\d:\d\d:\d\d)\] \[(.*?)\]: (.*)$")
+coordinate_parsers = [
+    re.compile(rf"\b{axis}=(-?\d+\.\d+)") for axis in ("x", "y", "z")
+]
 
 # maps uuids to open session starting times
 open_sessions: dict[str, datetime] = {}
-# maps usernames to uuids. as the parse function proceeds through the log files, this
-# dict is updated to map the most recent username a player was seen with to their
-# uuid
-usernames: dict[str, str] = {}
 
 
 def get_user_by_uuid(uuid: str, session: DBSession) -> User:
@@ -33,18 +31,113 @@ def get_user_by_uuid(uuid: str, session: DBSession) -> User:
     return result[0] if result else None
 
 
-def get_user_by_username(username: str, session: DBSession) -> User:
+def parse_coordinates(villager_data: str) -> tuple[float, float, float]:
     """
-    Returns a User object obtained by looking up the Minecraft UUID that is currently
-    associated with a username and then using that UUID to obtain a User object from
-    the database.
+    Returns the x, y, and z coordinates from the data that the server logs about a
+    villager when it dies. Coordinates that are missing from the data are None.
     """
-    return get_user_by_uuid(usernames[username], session)
+    matches = [parser.search(villager_data) for parser in coordinate_parsers]
+    return tuple(float(x.group(1)) if x else None for x in matches)
+
+
+def backfill_villager_coordinates(engine) -> None:
+    """
+    Brings a villager_deaths table from before the x, y, and z columns were added up
+    to date: the missing columns and their indexes are created, and villager deaths
+    that were stored without coordinates get them by parsing their villager_data.
+    parse() runs this before it reads any logs, so it only does anything the first
+    time a database created before the columns existed is parsed into.
+    """
+    table = VillagerDeath.__table__
+    existing_columns = {
+        x["name"] for x in inspect(engine).get_columns(table.name)
+    }
+    with engine.begin() as connection:
+        for column in (table.c.x, table.c.y, table.c.z):
+            if column.name not in existing_columns:
+                connection.execute(
+                    text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} " +
+                         column.type.compile(engine.dialect)))
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+    with DBSession(engine) as session:
+        rows = session.execute(
+            select(VillagerDeath.id, VillagerDeath.villager_data).where(
+                VillagerDeath.x.is_(None))).all()
+        updates = []
+        for death_id, villager_data in rows:
+            death_x, death_y, death_z = parse_coordinates(villager_data or "")
+            updates.append({
+                "id": death_id,
+                "x": death_x,
+                "y": death_y,
+                "z": death_z
+            })
+        session.bulk_update_mappings(VillagerDeath, updates)
+        session.commit()
+
+
+def get_username_record(username: str, time: datetime,
+                        session: DBSession) -> UsernameHistory:
+    """
+    Returns the UsernameHistory row of the player that most recently took a username
+    at or before a given time. This is a single lookup in the (username, first_seen)
+    index. The player might have stopped using the username before that time, which
+    can be checked by comparing the row's last_seen to it. If nobody had taken the
+    username by that time, this method returns None.
+    """
+    stmt = select(UsernameHistory).where(
+        UsernameHistory.username == username,
+        UsernameHistory.first_seen <= time).order_by(
+            UsernameHistory.first_seen.desc()).limit(1)
+    result = session.execute(stmt).first()
+    return result[0] if result else None
+
+
+def get_user_by_username(username: str, time: datetime,
+                         session: DBSession) -> User:
+    """
+    Returns the User object for the player that most recently took a username at or
+    before a given time (see get_username_record), so that a username that has been
+    given up and then taken by someone else is still attributed to the right player.
+    If nobody had taken the username by that time, this method returns None.
+    """
+    record = get_username_record(username, time, session)
+    return record.user if record else None
+
+
+def get_latest_username_record(user_id: int,
+                               session: DBSession) -> UsernameHistory:
+    """
+    Returns the most recent UsernameHistory row for a user, using the (user_id,
+    first_seen) index. If the user has no history yet, this method returns None.
+    """
+    stmt = select(UsernameHistory).where(
+        UsernameHistory.user_id == user_id).order_by(
+            UsernameHistory.first_seen.desc()).limit(1)
+    result = session.execute(stmt).first()
+    return result[0] if result else None
+
+
+def see_username(username: str, time: datetime, session: DBSession) -> User:
+    """
+    Looks up the player that had a username at a given time like get_user_by_username
+    and also extends that username's history row up to that time.
+    """
+    record = get_username_record(username, time, session)
+    if not record:
+        return None
+    record.last_seen = time
+    return record.user
 
 
 def parse(engine):
+    backfill_villager_coordinates(engine)
     unused_lines = []
-    log_files = list(
+    # the files are parsed in chronological order so that username history is
+    # recorded in the order that it happened
+    log_files = sorted(
         Path('./logs/').glob("*.log.gz")) + [Path("./logs/latest.log")]
     for file in list(log_files):
         if file.name == "latest.log":
@@ -91,26 +184,38 @@ def parse(engine):
                     if not uuid_declaration:
                         continue
                     username, uuid = uuid_declaration.group(1, 2)
-                    usernames[username] = uuid
                     match = get_user_by_uuid(uuid, session)
                     if not match:
-                        new_user = User(username=username, minecraft_uuid=uuid)
-                        session.add(new_user)
+                        match = User(minecraft_uuid=uuid)
+                        session.add(match)
+                        latest_record = None
+                    else:
+                        latest_record = get_latest_username_record(
+                            match.id, session)
+                    match.username = username
+                    record = get_username_record(username, timestamp, session)
+                    if record and latest_record and record.id == latest_record.id:
+                        record.last_seen = timestamp
                     else:
-                        if match.username != username:
-                            past_usernames = json.loads(
-                                match.past_usernames) + [username]
-                            match.past_usernames = json.dumps(past_usernames)
+                        # either this is a new player, or the player has a new name,
+                        # or they have gone back to a name that they used before or
+                        # that someone else has used since
+                        session.add(
+                            UsernameHistory(user=match,
+                                            username=username,
+                                            first_seen=timestamp,
+                                            last_seen=timestamp))
                 elif source == "Server thread/INFO":
                     if join_message_match := re.match(r"^(.*) joined the game$",
                                                       message):
-                        player_uuid = usernames[join_message_match.group(1)]
-                        open_sessions[player_uuid] = timestamp
+                        player = see_username(join_message_match.group(1),
+                                              timestamp, session)
+                        open_sessions[player.minecraft_uuid] = timestamp
                     elif leave_message_match := re.match(
                             r"^(.*) left the game$", message):
-                        player_uuid = usernames[leave_message_match.group(1)]
-                        start_time = open_sessions[player_uuid]
-                        player = get_user_by_uuid(player_uuid, session)
+                        player = see_username(leave_message_match.group(1),
+                                              timestamp, session)
+                        start_time = open_sessions[player.minecraft_uuid]
                         session.add(
                             PlaySession(start_time=start_time,
                                         end_time=timestamp,
@@ -120,30 +225,30 @@ def parse(engine):
                             message):
                         death_data, death_message = villager_died_message_match.group(
                             1, 2)
-                        death_x = re.search(r"x=(-?\d+\.\d+)",
-                                            death_data).group(1)
-                        death_z = re.search(r"z=(-?\d+\.\d+)",
-                                            death_data).group(1)
+                        death_x, death_y, death_z = parse_coordinates(death_data)
                         session.add(
                             VillagerDeath(
                                 time=timestamp,
                                 had_profession=(
                                     not death_message.startswith("Villager")),
                                 villager_data=death_data,
+                                x=death_x,
+                                y=death_y,
+                                z=death_z,
                                 village_name=village_index.get_closest_village(
-                                    float(death_x), float(death_z)),
+                                    death_x, death_z),
                                 message=death_message))
                     elif chat_message_match := re.match(r"^<(.*?)> (.*)$",
                                                         message):
                         chatter, chat_message = chat_message_match.group(1, 2)
-                        player = get_user_by_username(chatter, session)
+                        player = see_username(chatter, timestamp, session)
                         session.add(
                             ChatMessage(time=timestamp,
                                         user=player,
                                         message=chat_message))
                     elif died_message_match := is_death_message(message):
                         dier_username = died_message_match.group(1)
-                        dier = get_user_by_username(dier_username, session)
+                        dier = see_username(dier_username, timestamp, session)
                         session.add(
                             UserDeath(time=timestamp,
                                       user=dier,
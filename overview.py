@@ -0,0 +1,271 @@
+from tables import User, UserDeath, VillagerDeath, PlaySession, engine
+from log_parser import parse
+from diagrammer import get_color
+
+from datetime import date, datetime, timedelta
+from xml.sax.saxutils import unescape
+
+from sqlalchemy.orm import Session as DBSession
+from sqlalchemy import select
+
+import numpy as np
+import drawSvg
+from webcolors import hex_to_rgb, rgb_to_hex
+
+SECONDS_PER_HOUR = 60 * 60
+HOURS_PER_DAY = 24
+
+USER_DEATHS_COLOR = "#8E7DBE"
+VILLAGER_DEATHS_COLOR = "#E2A458"
+EMPTY_CELL_COLOR = "#EEEEEE"
+
+
+def to_seconds(times: list[datetime], origin: datetime) -> np.ndarray:
+    """
+    Converts a list of datetimes into an array of whole seconds elapsed since origin.
+    """
+    return (np.array(times, dtype="datetime64[s]") -
+            np.datetime64(origin, "s")).astype(np.int64)
+
+
+def get_shaded_color(color: str, fraction: float) -> str:
+    """
+    Blends a color with white; a fraction of 0 gives a pale tint of the color and a
+    fraction of 1 gives the color itself.
+    """
+    weight = 0.2 + 0.8 * fraction
+    return rgb_to_hex(
+        tuple(
+            int(255 - (255 - x) * weight) for x in hex_to_rgb(color)))
+
+
+class ActivityBins():
+    """
+    Hours played per user and deaths per day for the days from first_date to last_date,
+    inclusive. Everything is computed once, in __init__, from plain column values; no
+    ORM objects are loaded.
+    """
+
+    def __init__(self, first_date: date, last_date: date, db_session: DBSession):
+        self.first_date = first_date
+        self.last_date = last_date
+        self.number_of_days = (last_date - first_date).days + 1
+
+        # the earliest moment that is part of the range
+        self.lower_bound = datetime.combine(first_date, datetime.min.time())
+        # the moment just after the end of the range
+        upper_bound = self.lower_bound + timedelta(days=self.number_of_days)
+        number_of_hours = self.number_of_days * HOURS_PER_DAY
+        range_seconds = number_of_hours * SECONDS_PER_HOUR
+
+        session_rows = db_session.execute(
+            select(PlaySession.user_id, PlaySession.start_time,
+                   PlaySession.end_time).where(
+                       PlaySession.start_time < upper_bound,
+                       PlaySession.end_time > self.lower_bound)).all()
+        user_ids = [x[0] for x in session_rows]
+        starts = np.clip(to_seconds([x[1] for x in session_rows],
+                                    self.lower_bound), 0, range_seconds)
+        ends = np.clip(to_seconds([x[2] for x in session_rows],
+                                  self.lower_bound), 0, range_seconds)
+        nonempty = ends > starts
+        starts, ends = starts[nonempty], ends[nonempty]
+
+        # one row per user; user_rows maps each session to its user's row
+        unique_user_ids, user_rows = np.unique(
+            np.array(user_ids, dtype=np.int64)[nonempty], return_inverse=True)
+        self.user_ids: list[int] = unique_user_ids.tolist()
+
+        # each session contributes a partial hour to the hour it starts in and the
+        # hour it ends in and a full hour to every hour in between; the full hours
+        # are added with a difference array so that the work done is proportional
+        # to the number of sessions and not to their lengths
+        first_hours = starts // SECONDS_PER_HOUR
+        last_hours = (ends - 1) // SECONDS_PER_HOUR
+        single_hour = first_hours == last_hours
+        seconds = np.zeros((len(self.user_ids), number_of_hours), dtype=np.int64)
+        np.add.at(
+            seconds, (user_rows, first_hours),
+            np.where(single_hour, ends - starts,
+                     (first_hours + 1) * SECONDS_PER_HOUR - starts))
+        np.add.at(seconds, (user_rows, last_hours),
+                  np.where(single_hour, 0, ends - last_hours * SECONDS_PER_HOUR))
+        full_hours = np.zeros((len(self.user_ids), number_of_hours + 1),
+                              dtype=np.int64)
+        full_hour_seconds = np.where(single_hour, 0, SECONDS_PER_HOUR)
+        np.add.at(full_hours, (user_rows, first_hours + 1), full_hour_seconds)
+        np.add.at(full_hours, (user_rows, last_hours), -full_hour_seconds)
+        seconds += np.cumsum(full_hours, axis=1)[:, :-1]
+
+        # seconds played by each user during each hour of the range
+        self.hourly_seconds_played = seconds
+        # hours played by each user on each day of the range
+        self.daily_hours_played = seconds.reshape(
+            len(self.user_ids), self.number_of_days,
+            HOURS_PER_DAY).sum(axis=2) / SECONDS_PER_HOUR
+
+        self.usernames: dict[int, str] = dict(
+            db_session.execute(
+                select(User.id,
+                       User.username).where(User.id.in_(self.user_ids))).all())
+
+        self.daily_user_deaths = self._count_per_day(UserDeath.time, db_session,
+                                                     upper_bound)
+        self.daily_villager_deaths = self._count_per_day(
+            VillagerDeath.time, db_session, upper_bound)
+
+    def __repr__(self) -> str:
+        return f"activity from {self.first_date} to {self.last_date}"
+
+    def _count_per_day(self, time_column, db_session: DBSession,
+                       upper_bound: datetime) -> np.ndarray:
+        times = db_session.execute(
+            select(time_column).where(time_column >= self.lower_bound,
+                                      time_column < upper_bound)).scalars().all()
+        days = to_seconds(times, self.lower_bound) // (SECONDS_PER_HOUR *
+                                                      HOURS_PER_DAY)
+        return np.bincount(days, minlength=self.number_of_days)
+
+
+class Overview():
+    """
+    A calendar heatmap with one cell per day. For every year in the binned range, there
+    is a calendar for each user's hours played and one each for player and villager
+    deaths, so the number of elements drawn depends only on the number of days and
+    users and not on the number of sessions or deaths.
+    """
+
+    def __init__(self, title: str, bins: ActivityBins):
+        self.title = title
+        self.bins = bins
+
+        self.title_height = 55
+        self.title_font_size = 50
+        self.year_height = 40
+        self.year_font_size = 30
+        self.label_height = 25
+        self.label_font_size = 15
+        self.cell_size = 18
+        self.cell_gap = 2
+        self.gap_between_calendars = 15
+        self.left_right_margins = 10
+
+        self.years = list(range(bins.first_date.year, bins.last_date.year + 1))
+        # (label, color, values per day) for each calendar drawn per year
+        self.series: list[tuple[str, str, np.ndarray]] = [
+            (f"{bins.usernames.get(user_id, user_id)}: hours played",
+             get_color(user_id), bins.daily_hours_played[i])
+            for i, user_id in enumerate(bins.user_ids)
+        ] + [("Player deaths", USER_DEATHS_COLOR, bins.daily_user_deaths),
+             ("Villager deaths", VILLAGER_DEATHS_COLOR,
+              bins.daily_villager_deaths)]
+
+    def __repr__(self) -> str:
+        return f"overview titled {self.title}"
+
+    @property
+    def calendar_height(self) -> int:
+        return 7 * (self.cell_size + self.cell_gap)
+
+    @property
+    def width(self) -> int:
+        return 54 * (self.cell_size + self.cell_gap) + self.left_right_margins * 2
+
+    @property
+    def height(self) -> int:
+        return (self.title_height + len(self.years) *
+                (self.year_height + len(self.series) *
+                 (self.label_height + self.calendar_height +
+                  self.gap_between_calendars)))
+
+    def render_calendar(self, drawing: drawSvg.Drawing, year: int, top: float,
+                        color: str, values: np.ndarray) -> None:
+        # only the part of the year that was binned is drawn
+        first_date = max(date(year, 1, 1), self.bins.first_date)
+        last_date = min(date(year, 12, 31), self.bins.last_date)
+        first_index = (first_date - self.bins.first_date).days
+        year_values = values[first_index:first_index +
+                             (last_date - first_date).days + 1]
+        # the largest value of the whole range sets the scale, so that years can be
+        # compared with each other
+        max_value = values.max() if len(values) else 0
+        # weekday() is 0 for monday, so that weeks run from monday to sunday
+        first_column_offset = date(year, 1, 1).weekday()
+
+        for i, value in enumerate(year_values.tolist()):
+            day = first_date + timedelta(days=i)
+            day_of_year = day.timetuple().tm_yday - 1
+            column = (day_of_year + first_column_offset) // 7
+            row = day.weekday()
+            drawing.append(
+                drawSvg.Rectangle(
+                    self.left_right_margins + column *
+                    (self.cell_size + self.cell_gap),
+                    top - (row + 1) * (self.cell_size + self.cell_gap),
+                    self.cell_size,
+                    self.cell_size,
+                    fill=(get_shaded_color(color, value / max_value)
+                          if value else EMPTY_CELL_COLOR)))
+
+    def render(self) -> drawSvg.Drawing:
+        drawing = drawSvg.Drawing(self.width, self.height)
+        drawing.append(
+            drawSvg.Text(self.title,
+                         self.title_font_size,
+                         self.left_right_margins,
+                         self.height - self.title_height,
+                         fill="black"))
+
+        amount_of_page_filled = self.title_height
+        for year in self.years:
+            amount_of_page_filled += self.year_height
+            drawing.append(
+                drawSvg.Text(str(year),
+                             self.year_font_size,
+                             self.left_right_margins,
+                             self.height - amount_of_page_filled + 5,
+                             fill="black"))
+            for label, color, values in self.series:
+                amount_of_page_filled += self.label_height
+                drawing.append(
+                    drawSvg.Text(label,
+                                 self.label_font_size,
+                                 self.left_right_margins,
+                                 self.height - amount_of_page_filled + 5,
+                                 fill="black",
+                                 font_family="monospace"))
+                self.render_calendar(drawing, year,
+                                     self.height - amount_of_page_filled, color,
+                                     values)
+                amount_of_page_filled += (self.calendar_height +
+                                          self.gap_between_calendars)
+        return drawing
+
+
+if __name__ == "__main__":
+    parse(engine)
+    with DBSession(engine) as session:
+        first_session: PlaySession = session.query(PlaySession).order_by(
+            PlaySession.start_time).first()
+        last_session: PlaySession = session.query(PlaySession).order_by(
+            PlaySession.end_time.desc()).first()
+
+        first_date = date(first_session.start_time.year, 1, 1)
+        last_date = date(last_session.end_time.year, 12, 31)
+
+        overviews = [
+            Overview(
+                str(year),
+                ActivityBins(date(year, 1, 1), date(year, 12, 31), session))
+            for year in range(first_date.year, last_date.year + 1)
+        ]
+        if len(overviews) > 1:
+            overviews.append(
+                Overview("All time",
+                         ActivityBins(first_date, last_date, session)))
+
+        for overview in overviews:
+            drawing = overview.render()
+            with open(f"./output/{overview.title} overview.svg",
+                      "w+") as output_file:
+                output_file.write(unescape(drawing.asSvg()))
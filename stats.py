@@ -0,0 +1,214 @@
+from tables import User, UserDeath, VillagerDeath, PlaySession, engine
+from log_parser import parse
+
+from datetime import date, datetime, timedelta
+from typing import Optional
+import argparse
+import csv
+import json
+import sys
+
+from sqlalchemy.orm import Session as DBSession
+from sqlalchemy import Integer, select, func, literal, cast
+
+# appended to a 'YYYY-MM-DD' date to make midnight of that day in the format that
+# SQLAlchemy stores datetimes in on SQLite
+DATETIME_SUFFIX = " 00:00:00.000000"
+
+# the aggregations below are done entirely by the database, which returns one row per
+# group; no ORM objects are created. a window is a half-open range of time
+# [start, end); either end of it can be None to leave that side unbounded
+
+
+def unix_time(time):
+    """
+    Returns a SQL expression for a timestamp as whole seconds since the epoch. (The
+    logs only have whole seconds in them, and this avoids the rounding errors that
+    come from subtracting julianday() values.)
+    """
+    return cast(func.strftime("%s", time), Integer)
+
+
+def clipped_session_seconds(start, end):
+    """
+    Returns a SQL expression for the number of seconds of a play session that fall
+    between start and end, which can be datetimes or SQL expressions.
+    """
+    session_start = (func.max(PlaySession.start_time, start)
+                     if start is not None else PlaySession.start_time)
+    session_end = (func.min(PlaySession.end_time, end)
+                   if end is not None else PlaySession.end_time)
+    return unix_time(session_end) - unix_time(session_start)
+
+
+def sessions_overlapping(stmt, start, end):
+    if start is not None:
+        stmt = stmt.where(PlaySession.end_time > start)
+    if end is not None:
+        stmt = stmt.where(PlaySession.start_time < end)
+    return stmt
+
+
+def events_within(stmt, time_column, start, end):
+    if start is not None:
+        stmt = stmt.where(time_column >= start)
+    if end is not None:
+        stmt = stmt.where(time_column < end)
+    return stmt
+
+
+def get_time_played_per_user(db_session: DBSession,
+                             start: Optional[datetime] = None,
+                             end: Optional[datetime] = None) -> list[dict]:
+    """
+    Returns the number of seconds each user played during the window, counting only
+    the parts of sessions that fall inside of it.
+    """
+    seconds = func.sum(clipped_session_seconds(start, end))
+    stmt = select(User.id.label("user_id"), User.username,
+                  seconds.label("seconds")).join(
+                      PlaySession, PlaySession.user_id == User.id).group_by(
+                          User.id).order_by(seconds.desc())
+    stmt = sessions_overlapping(stmt, start, end)
+    return [dict(x) for x in db_session.execute(stmt).mappings()]
+
+
+def get_time_played_per_day(db_session: DBSession,
+                            start: Optional[datetime] = None,
+                            end: Optional[datetime] = None) -> list[dict]:
+    """
+    Returns the number of seconds each user played on each day of the window. Each
+    session is split across the days that it overlaps by joining it to a recursive
+    table of days and clipping it to each one. If the window is unbounded, it is
+    narrowed to the days that have sessions in them.
+    """
+    if start is None or end is None:
+        first_start, last_end = db_session.execute(
+            select(func.min(PlaySession.start_time),
+                   func.max(PlaySession.end_time))).one()
+        if first_start is None:
+            return []
+        start = start or datetime.combine(first_start.date(),
+                                          datetime.min.time())
+        end = end or last_end
+    last_day = (end - timedelta(microseconds=1)).date()
+
+    days = select(literal(start.date().isoformat()).label("day")).cte(
+        "days", recursive=True)
+    days = days.union_all(
+        select(func.date(days.c.day, "+1 day")).where(
+            days.c.day < last_day.isoformat()))
+    # the window clipped to each day; the first and last days might be partial. the
+    # day boundaries are written in the same format that SQLAlchemy stores datetimes
+    # in so that they can be compared with the session columns as strings
+    day_start = func.max(days.c.day.concat(DATETIME_SUFFIX), start)
+    day_end = func.min(
+        func.date(days.c.day, "+1 day").concat(DATETIME_SUFFIX), end)
+
+    seconds = func.sum(clipped_session_seconds(day_start, day_end))
+    stmt = select(days.c.day, User.id.label("user_id"), User.username,
+                  seconds.label("seconds")).select_from(days).join(
+                      PlaySession,
+                      (PlaySession.start_time < day_end) &
+                      (PlaySession.end_time > day_start)).join(
+                          User, PlaySession.user_id == User.id).group_by(
+                              days.c.day, User.id).order_by(days.c.day, User.id)
+    return [dict(x) for x in db_session.execute(stmt).mappings()]
+
+
+def get_user_deaths_per_user(db_session: DBSession,
+                             start: Optional[datetime] = None,
+                             end: Optional[datetime] = None) -> list[dict]:
+    """
+    Returns the number of times each user died during the window.
+    """
+    deaths = func.count(UserDeath.id)
+    stmt = select(User.id.label("user_id"), User.username,
+                  deaths.label("deaths")).join(
+                      UserDeath, UserDeath.user_id == User.id).group_by(
+                          User.id).order_by(deaths.desc())
+    stmt = events_within(stmt, UserDeath.time, start, end)
+    return [dict(x) for x in db_session.execute(stmt).mappings()]
+
+
+def get_villager_deaths_per_village(db_session: DBSession,
+                                    start: Optional[datetime] = None,
+                                    end: Optional[datetime] = None) -> list[dict]:
+    """
+    Returns the number of villagers that died near each village during the window.
+    """
+    deaths = func.count(VillagerDeath.id)
+    stmt = select(VillagerDeath.village_name,
+                  deaths.label("deaths")).group_by(
+                      VillagerDeath.village_name).order_by(deaths.desc())
+    stmt = events_within(stmt, VillagerDeath.time, start, end)
+    return [dict(x) for x in db_session.execute(stmt).mappings()]
+
+
+def get_villager_deaths_per_day(db_session: DBSession,
+                                start: Optional[datetime] = None,
+                                end: Optional[datetime] = None) -> list[dict]:
+    """
+    Returns the number of villagers that died near each village on each day of the
+    window. Days with no deaths are left out.
+    """
+    day = func.date(VillagerDeath.time)
+    stmt = select(day.label("day"), VillagerDeath.village_name,
+                  func.count(VillagerDeath.id).label("deaths")).group_by(
+                      day, VillagerDeath.village_name).order_by(
+                          day, VillagerDeath.village_name)
+    stmt = events_within(stmt, VillagerDeath.time, start, end)
+    return [dict(x) for x in db_session.execute(stmt).mappings()]
+
+
+# maps each report name accepted by the command line to the function that makes it
+# and the names of the columns in its rows
+REPORTS = {
+    "time-per-user": (get_time_played_per_user,
+                      ["user_id", "username", "seconds"]),
+    "time-per-day": (get_time_played_per_day,
+                     ["day", "user_id", "username", "seconds"]),
+    "user-deaths": (get_user_deaths_per_user, ["user_id", "username", "deaths"]),
+    "villager-deaths": (get_villager_deaths_per_village,
+                        ["village_name", "deaths"]),
+    "villager-deaths-per-day": (get_villager_deaths_per_day,
+                                ["day", "village_name", "deaths"]),
+}
+
+
+def write_report(rows: list[dict], columns: list[str], output_format: str,
+                 output_file) -> None:
+    if output_format == "json":
+        json.dump(rows, output_file, indent=2)
+        output_file.write("\n")
+    else:
+        # the header is written even if there are no rows, so that an empty report
+        # can be told apart from a failed one
+        writer = csv.DictWriter(output_file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Print statistics about the server logs.")
+    arg_parser.add_argument("report", choices=REPORTS.keys())
+    arg_parser.add_argument("--start",
+                            type=date.fromisoformat,
+                            help="first day to include, as YYYY-MM-DD")
+    arg_parser.add_argument("--end",
+                            type=date.fromisoformat,
+                            help="last day to include, as YYYY-MM-DD")
+    arg_parser.add_argument("--format", choices=["json", "csv"], default="json")
+    args = arg_parser.parse_args()
+
+    start = (datetime.combine(args.start, datetime.min.time())
+             if args.start else None)
+    end = (datetime.combine(args.end + timedelta(days=1), datetime.min.time())
+           if args.end else None)
+
+    parse(engine)
+    report, columns = REPORTS[args.report]
+    with DBSession(engine) as session:
+        write_report(report(session, start, end), columns, args.format,
+                     sys.stdout)
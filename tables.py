@@ -1,9 +1,8 @@
 from datetime import timedelta, timezone
 from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, create_engine
+from sqlalchemy import Column, Integer, Float, String, DateTime, Boolean, Index, create_engine
 from sqlalchemy.sql.schema import ForeignKey
 
-import json
 import logging
 
 logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
@@ -17,16 +16,43 @@ class User(BaseTable):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
+    # the most recent username the user was seen with; see UsernameHistory for the
+    # usernames they had before that
     username = Column(String)
-    past_usernames = Column(String, default=json.dumps([]))
     minecraft_uuid = Column(String, unique=True, index=True)
 
     def __repr__(self):
-        return f"User(username={self.username}, id={self.id}, minecraft_uuid={self.minecraft_uuid}, past_usernames={self.past_usernames})"
+        return f"User(username={self.username}, id={self.id}, minecraft_uuid={self.minecraft_uuid})"
+
+
+class UsernameHistory(BaseTable):
+    """
+    One row for each continuous stretch of time during which a user had a username. A
+    username can appear in several rows if it was given up by one player and then
+    taken by another, so the owner of a username at a given time is the row with the
+    latest first_seen that is not after that time.
+    """
+    __tablename__ = "username_history"
+    __table_args__ = (Index("ix_username_history_username_first_seen",
+                            "username", "first_seen"),
+                      Index("ix_username_history_user_id_first_seen", "user_id",
+                            "first_seen"))
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey(User.id))
+    user = relationship(User)
+    username = Column(String)
+    first_seen = Column(DateTime, index=True)
+    last_seen = Column(DateTime, index=True)
+
+    def __repr__(self):
+        return f"{self.user.username} was called {self.username} from {self.first_seen} to {self.last_seen}"
 
 
 class PlaySession(BaseTable):
     __tablename__ = "sessions"
+    __table_args__ = (Index("ix_sessions_user_id_start_time", "user_id",
+                            "start_time"),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     start_time = Column(DateTime, index=True)
@@ -44,6 +70,7 @@ class PlaySession(BaseTable):
 
 class UserDeath(BaseTable):
     __tablename__ = "user_deaths"
+    __table_args__ = (Index("ix_user_deaths_user_id_time", "user_id", "time"),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     time = Column(DateTime, index=True)
@@ -57,11 +84,17 @@ class UserDeath(BaseTable):
 
 class VillagerDeath(BaseTable):
     __tablename__ = "villager_deaths"
+    __table_args__ = (Index("ix_villager_deaths_village_name_time",
+                            "village_name", "time"),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     time = Column(DateTime, index=True)
     had_profession = Column(Boolean)
     villager_data = Column(String)
+    # the coordinates of the villager when it died, from villager_data
+    x = Column(Float, index=True)
+    y = Column(Float, index=True)
+    z = Column(Float, index=True)
     village_name = Column(String, index=True)
     message = Column(String)
 
@@ -0,0 +1,191 @@
+from tables import VillagerDeath, engine
+from log_parser import parse
+from overview import get_shaded_color
+from villages import village_index, VillageIndex
+
+from datetime import datetime
+from math import ceil, floor
+from typing import Optional
+from xml.sax.saxutils import unescape
+
+from sqlalchemy.orm import Session as DBSession
+from sqlalchemy import select
+
+import numpy as np
+import drawSvg
+
+DEATHS_COLOR = "#D62828"
+# how far past the outermost villages the grid extends when it is not given bounds,
+# which is the same distance that get_closest_village looks for villages within
+DEFAULT_MARGIN = 1000
+
+
+class VillagerDeathGrid():
+    """
+    The number of villager deaths in each cell of a grid of square, cell_size by
+    cell_size block areas, covering every death between start and end (either of
+    which can be None to leave that side unbounded). The grid covers the area from
+    (min_x, min_z) to (max_x, max_z) given by bounds, which defaults to the area around
+    the villages in village_index; deaths outside of it are left out, so that the size
+    of the grid does not depend on where the deaths are. The coordinates are read as
+    plain column values and counted in one pass with np.bincount.
+    """
+
+    def __init__(self,
+                 db_session: DBSession,
+                 cell_size: int = 16,
+                 start: Optional[datetime] = None,
+                 end: Optional[datetime] = None,
+                 bounds: Optional[tuple[int, int, int, int]] = None):
+        self.cell_size = cell_size
+        min_x, min_z, max_x, max_z = bounds or village_index.get_bounds(
+            DEFAULT_MARGIN)
+
+        # the cell in the north-west corner of the grid
+        self.min_column = floor(min_x / cell_size)
+        self.min_row = floor(min_z / cell_size)
+        self.columns = max(ceil(max_x / cell_size) - self.min_column, 1)
+        self.rows = max(ceil(max_z / cell_size) - self.min_row, 1)
+
+        stmt = select(VillagerDeath.x, VillagerDeath.z).where(
+            VillagerDeath.x >= min_x, VillagerDeath.x < max_x,
+            VillagerDeath.z >= min_z, VillagerDeath.z < max_z)
+        if start is not None:
+            stmt = stmt.where(VillagerDeath.time >= start)
+        if end is not None:
+            stmt = stmt.where(VillagerDeath.time < end)
+        coordinates = np.array(db_session.execute(stmt).all(),
+                               dtype=np.float64).reshape(-1, 2)
+        cells = np.floor(coordinates / cell_size).astype(np.int64)
+
+        # rows go from north to south (increasing z) and columns go from west to east
+        # (increasing x)
+        flat_indexes = ((cells[:, 1] - self.min_row) * self.columns +
+                        (cells[:, 0] - self.min_column))
+        self.counts = np.bincount(flat_indexes,
+                                  minlength=self.rows * self.columns).reshape(
+                                      self.rows, self.columns)
+
+    def __repr__(self) -> str:
+        return f"{self.rows}x{self.columns} grid of {self.cell_size} block cells"
+
+    def get_cell_corner(self, row: int, column: int) -> tuple[int, int]:
+        """
+        Returns the x and z coordinates of the north-west corner of a cell.
+        """
+        return ((self.min_column + column) * self.cell_size,
+                (self.min_row + row) * self.cell_size)
+
+    def get_hotspots(self, count: int = 10) -> list[tuple[int, int, int]]:
+        """
+        Returns the x and z coordinates of the north-west corners of the cells with the
+        most deaths, along with the number of deaths in each, with the most deadly
+        first.
+        """
+        flat_counts = self.counts.ravel()
+        count = min(count, np.count_nonzero(flat_counts))
+        if not count:
+            return []
+        top = np.argpartition(flat_counts, -count)[-count:]
+        top = top[np.argsort(flat_counts[top])[::-1]]
+        return [
+            self.get_cell_corner(*divmod(int(i), self.columns)) +
+            (int(flat_counts[i]),) for i in top
+        ]
+
+
+class VillagerHeatmap():
+    """
+    Draws a VillagerDeathGrid with one rectangle per cell that has deaths in it, north
+    up, and optionally marks the villages from a VillageIndex that are inside of the
+    grid.
+    """
+
+    def __init__(self,
+                 grid: VillagerDeathGrid,
+                 villages: Optional[VillageIndex] = village_index):
+        self.grid = grid
+        self.villages = villages
+
+        self.title_height = 55
+        self.title_font_size = 50
+        self.cell_width = 4
+        self.margins = 10
+        self.village_marker_radius = 5
+        self.village_font_size = 15
+
+    @property
+    def width(self) -> int:
+        return self.grid.columns * self.cell_width + self.margins * 2
+
+    @property
+    def height(self) -> int:
+        return (self.title_height + self.grid.rows * self.cell_width +
+                self.margins * 2)
+
+    def get_position(self, x: float, z: float) -> tuple[float, float]:
+        """
+        Converts Minecraft x and z coordinates into a position in the drawing.
+        """
+        block_width = self.cell_width / self.grid.cell_size
+        left_x, top_z = self.grid.get_cell_corner(0, 0)
+        return (self.margins + (x - left_x) * block_width,
+                self.margins + self.grid.rows * self.cell_width -
+                (z - top_z) * block_width)
+
+    def render(self) -> drawSvg.Drawing:
+        drawing = drawSvg.Drawing(self.width, self.height)
+        drawing.append(
+            drawSvg.Text("Villager deaths",
+                         self.title_font_size,
+                         self.margins,
+                         self.height - self.title_height,
+                         fill="black"))
+
+        max_count = self.grid.counts.max()
+        for row, column in zip(*np.nonzero(self.grid.counts)):
+            count = self.grid.counts[row, column]
+            drawing.append(
+                drawSvg.Rectangle(self.margins + column * self.cell_width,
+                                  self.margins +
+                                  (self.grid.rows - row - 1) * self.cell_width,
+                                  self.cell_width,
+                                  self.cell_width,
+                                  fill=get_shaded_color(DEATHS_COLOR,
+                                                        count / max_count)))
+
+        if self.villages:
+            left_x, top_z = self.grid.get_cell_corner(0, 0)
+            right_x, bottom_z = self.grid.get_cell_corner(self.grid.rows,
+                                                          self.grid.columns)
+            for name, x, z in sorted(self.villages.villages):
+                if not (left_x <= x <= right_x and top_z <= z <= bottom_z):
+                    continue
+                marker_x, marker_y = self.get_position(x, z)
+                drawing.append(
+                    drawSvg.Circle(marker_x,
+                                   marker_y,
+                                   self.village_marker_radius,
+                                   fill="none",
+                                   stroke="black",
+                                   stroke_width=2))
+                drawing.append(
+                    drawSvg.Text(name,
+                                 self.village_font_size,
+                                 marker_x + self.village_marker_radius * 2,
+                                 marker_y - self.village_font_size / 2,
+                                 fill="black",
+                                 font_family="monospace"))
+        return drawing
+
+
+if __name__ == "__main__":
+    parse(engine)
+    with DBSession(engine) as session:
+        grid = VillagerDeathGrid(session)
+        for x, z, count in grid.get_hotspots():
+            print(f"{count} villager deaths between x={x}, z={z} and " +
+                  f"x={x + grid.cell_size}, z={z + grid.cell_size}")
+        drawing = VillagerHeatmap(grid).render()
+        with open("./output/villager deaths.svg", "w+") as output_file:
+            output_file.write(unescape(drawing.asSvg()))
@@ -9,6 +9,16 @@ class VillageIndex:
     def add_village(self, name: str, x: int, z: int) -> None:
         self.villages.add((name, x, z))
 
+    def get_bounds(self, margin: int = 0) -> tuple[int, int, int, int]:
+        """
+        Returns the smallest and largest x and z coordinates of the registered villages,
+        as (min_x, min_z, max_x, max_z), with margin blocks added on every side.
+        """
+        xs = [village[1] for village in self.villages]
+        zs = [village[2] for village in self.villages]
+        return (min(xs) - margin, min(zs) - margin, max(xs) + margin,
+                max(zs) + margin)
+
     def get_closest_village(self, x: int, z: int) -> str:
         # maps village names to the distance between the village and (x, z)
         village_dists: dict[str, int] = {}